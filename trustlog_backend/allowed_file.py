@@ -1,9 +1,34 @@
 # trustlog_backend/allowed_file.py
 
+import orjson
+from flask import current_app
 from trustlog_backend.config import Config # Absolute import of Config class
 
+# Normalized once at import so each check is a single O(1) set lookup
+_ALLOWED_EXT_SET = frozenset(ext.lower().lstrip('.') for ext in Config.ALLOWED_EXTENSIONS)
+
+# The extension list never changes while the process runs, so its JSON body is encoded once
+_ALLOWED_EXT_BODY = orjson.dumps(sorted(_ALLOWED_EXT_SET), option=orjson.OPT_APPEND_NEWLINE)
+
+def allowed_extension(filename):
+    """Returns the filename's lowercased extension if ALLOWED_EXTENSIONS permits it, else None.
+
+    Allowed extensions are plain ASCII, so the result is already safe to put in a stored filename.
+    """
+    _, dot, ext = filename.rpartition('.')
+    ext = ext.lower()
+    return ext if dot and ext in _ALLOWED_EXT_SET else None
+
 # Helper function for file extension validation
 def allowed_file(filename):
     """Checks if the file extension is allowed based on ALLOWED_EXTENSIONS from Config."""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
\ No newline at end of file
+    return allowed_extension(filename) is not None
+
+def allowed_extensions_response(cache_control):
+    """Builds the allowed-extensions JSON response from the pre-encoded body.
+
+    A fresh response object per request, since after_request hooks (CORS) add headers to it.
+    """
+    response = current_app.response_class(_ALLOWED_EXT_BODY, mimetype='application/json')
+    response.headers['Cache-Control'] = cache_control
+    return response
@@ -1,19 +1,28 @@
 # trustlog_backend/app.py
 
+import logging
 from flask import Flask
 from flask_cors import CORS
 from flask_login import LoginManager
 from trustlog_backend.config import Config
-from trustlog_backend.database import init_db
+from trustlog_backend.database import init_db, release_db_connection, close_db_connection
+from trustlog_backend.json_provider import OrjsonProvider
+from trustlog_backend.spooled_request import SpooledRequest
 from trustlog_backend.models import User
 from trustlog_backend.auth import auth_bp
-from trustlog_backend.routes.logs import logs_bp # Import logs blueprint
+from trustlog_backend.routes.logs import logs_bp, NEXT_CURSOR_HEADER # Import logs blueprint
 
 def create_app():
+    # No-op when the hosting server has already configured logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = OrjsonProvider(app)
+    app.request_class = SpooledRequest
 
-    CORS(app, supports_credentials=True)
+    # The list endpoint's paging cursor travels in a header, which browsers hide from scripts unless exposed
+    CORS(app, supports_credentials=True, expose_headers=[NEXT_CURSOR_HEADER])
 
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -30,6 +39,9 @@ def create_app():
             return jsonify({"error": "Unauthorized: Please log in to access this resource"}), 401
         return "Unauthorized access. Please log in.", 401 # Fallback for non-API, non-redirect
 
+    # Hand each request's connection back to the pool once it is done
+    app.teardown_appcontext(release_db_connection)
+
     # Register Blueprints
     app.register_blueprint(auth_bp, url_prefix='/api')
     app.register_blueprint(logs_bp, url_prefix='/api/log_records')
@@ -37,6 +49,8 @@ def create_app():
     # Initialize the database within the app context
     with app.app_context():
         init_db()
+    # Don't leave the connection init_db used open, idle in the pool, across a fork
+    close_db_connection()
 
     return app
 
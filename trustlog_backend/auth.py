@@ -1,14 +1,78 @@
 # trustlog_backend/auth.py
 
-from flask import Blueprint, request, jsonify, current_app
+import hashlib
+import hmac
+import sqlite3
+import threading
+import time
+from flask import Blueprint, request, jsonify, current_app, session
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, logout_user, login_required, current_user
-from trustlog_backend.database import get_db_connection
+from trustlog_backend.database import get_db_connection, write_lock
 from trustlog_backend.models import User
-from trustlog_backend.config import Config # Import Config to access ALLOWED_EXTENSIONS
+from trustlog_backend.allowed_file import allowed_extensions_response
+from trustlog_backend.config import Config
 
 auth_bp = Blueprint('auth', __name__)
 
+SELECT_USER_ID_BY_USERNAME_SQL = "SELECT id FROM users WHERE username = ?"
+INSERT_USER_SQL = "INSERT INTO users (username, password_hash) VALUES (?, ?) RETURNING id"
+
+# Session key holding the logged-in username, so /status can answer without loading the user
+_SESSION_USERNAME_KEY = 'username'
+
+# Password hashing is deliberately CPU-heavy. This caps how many KDFs this process runs at once; further register
+# and login requests wait here for a slot. PASSWORD_KDF_CONCURRENCY is one worker process's share of the cores, so
+# across all gunicorn workers at most about one KDF per core runs and a login burst queues instead of
+# oversubscribing the CPU. The KDFs release the GIL, so they run on the request thread itself.
+_kdf_slots = threading.BoundedSemaphore(Config.PASSWORD_KDF_CONCURRENCY)
+
+def _run_kdf(func, *args, **kwargs):
+    """Runs generate_password_hash/check_password_hash on the request thread once a KDF slot is free."""
+    with _kdf_slots:
+        return func(*args, **kwargs)
+
+# Checked against when the username doesn't exist, so a failed login costs one KDF run either way and its
+# timing doesn't reveal which usernames are registered
+_dummy_password_hashes = {} # PASSWORD_HASH_METHOD -> hash
+
+def _dummy_password_hash():
+    """A hash made with the app's configured method, so checking it costs the same as checking a real one."""
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    password_hash = _dummy_password_hashes.get(method)
+    if password_hash is None:
+        password_hash = _run_kdf(generate_password_hash, 'not-a-real-password', method=method)
+        _dummy_password_hashes[method] = password_hash
+    return password_hash
+
+# Successful password checks, keyed by an HMAC of the credentials and the stored hash (so a new hash misses)
+_VERIFY_CACHE_MAX = 1024
+_verify_cache = {} # digest -> expires_at
+_verify_cache_lock = threading.Lock()
+
+def _verify_password(user, password):
+    """check_password_hash, optionally remembered for PASSWORD_VERIFY_CACHE_TTL seconds after a success."""
+    ttl = current_app.config['PASSWORD_VERIFY_CACHE_TTL']
+    if not ttl:
+        return _run_kdf(check_password_hash, user.password_hash, password)
+
+    key = hmac.new(
+        current_app.config['SECRET_KEY'].encode(),
+        b'\0'.join(value.encode() for value in (user.username, user.password_hash, password)),
+        hashlib.sha256
+    ).digest()
+    now = time.monotonic()
+    expires_at = _verify_cache.get(key)
+    if expires_at is not None and expires_at > now:
+        return True
+    if not _run_kdf(check_password_hash, user.password_hash, password):
+        return False
+    with _verify_cache_lock:
+        if len(_verify_cache) >= _VERIFY_CACHE_MAX:
+            _verify_cache.clear()
+        _verify_cache[key] = now + ttl
+    return True
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -19,25 +83,22 @@ def register():
         return jsonify({"error": "Username and password are required"}), 400
 
     conn = get_db_connection()
-    existing_user = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+    existing_user = conn.execute(SELECT_USER_ID_BY_USERNAME_SQL, (username,)).fetchone()
     if existing_user:
-        conn.close()
         return jsonify({"error": "Username already exists"}), 409
 
-    hashed_password = generate_password_hash(password)
+    hashed_password = _run_kdf(generate_password_hash, password, method=current_app.config['PASSWORD_HASH_METHOD'])
     try:
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, hashed_password))
-        conn.commit()
-        new_user_id = cursor.lastrowid
-        user = User.get(new_user_id)
+        with write_lock: # A single autocommitted INSERT, so there is no transaction to roll back on failure
+            new_user_id = conn.execute(INSERT_USER_SQL, (username, hashed_password)).fetchone()[0]
+        # Everything the User holds is already known, so it is built directly instead of read back
+        user = User(new_user_id, username, hashed_password)
         login_user(user)
+        session[_SESSION_USERNAME_KEY] = user.username
         return jsonify({"message": "User registered and logged in successfully", "username": user.username}), 201
     except sqlite3.Error as e:
-        current_app.logger.error(f"Database error during registration: {e}")
+        current_app.logger.error("Database error during registration: %s", e)
         return jsonify({"error": "Could not register user", "details": str(e)}), 500
-    finally:
-        conn.close()
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
@@ -49,8 +110,11 @@ def login():
         return jsonify({"error": "Username and password are required"}), 400
 
     user = User.get_by_username(username)
-    if user and check_password_hash(user.password_hash, password):
+    if user is None:
+        _run_kdf(check_password_hash, _dummy_password_hash(), password)
+    elif _verify_password(user, password):
         login_user(user)
+        session[_SESSION_USERNAME_KEY] = user.username
         return jsonify({"message": "Logged in successfully", "username": user.username}), 200
     return jsonify({"error": "Invalid username or password"}), 401
 
@@ -58,15 +122,20 @@ def login():
 @login_required
 def logout():
     logout_user()
+    session.pop(_SESSION_USERNAME_KEY, None)
     return jsonify({"message": "Logged out successfully"}), 200
 
 @auth_bp.route('/status', methods=['GET'])
 def get_status():
     """Returns application status and user authentication status."""
+    # Sessions from login/register carry the username, so the user is never loaded here
+    username = session.get(_SESSION_USERNAME_KEY) if '_user_id' in session else None
+    if username is None and current_user.is_authenticated:
+        username = current_user.username
     return jsonify({
         "message": "TrustLog Backend is running.",
-        "authenticated": current_user.is_authenticated,
-        "username": current_user.username if current_user.is_authenticated else None
+        "authenticated": username is not None,
+        "username": username
     })
 
 # NEW: Moved from logs.py
@@ -74,4 +143,4 @@ def get_status():
 def get_allowed_extensions():
     """API endpoint to retrieve the list of allowed file extensions for uploads."""
     # This endpoint is NOT login_required by design, so frontend can get types before login
-    return jsonify(list(Config.ALLOWED_EXTENSIONS)), 200
\ No newline at end of file
+    return allowed_extensions_response('public, max-age=86400')
\ No newline at end of file
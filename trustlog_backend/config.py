@@ -5,11 +5,29 @@ import os
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'a_very_super_secret_key_change_this_in_production_really'
 
+    # Explicit KDF and cost so login latency doesn't shift with Werkzeug's defaults. Hashes record their own method,
+    # so raising the cost here only affects new passwords and existing ones still verify.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    # Opt-in: seconds a successful password check is remembered, so repeat logins skip the KDF. 0 disables it.
+    PASSWORD_VERIFY_CACHE_TTL = int(os.environ.get('PASSWORD_VERIFY_CACHE_TTL') or 0)
+    # Password KDFs one process runs at once. gunicorn.conf.py starts GUNICORN_WORKERS processes (one per core unless
+    # set), so by default each gets its share of the cores and all workers together run about one KDF per core.
+    PASSWORD_KDF_CONCURRENCY = int(
+        os.environ.get('PASSWORD_KDF_CONCURRENCY')
+        or max(1, (os.cpu_count() or 1) // int(os.environ.get('GUNICORN_WORKERS') or os.cpu_count() or 1))
+    )
+
     DATABASE = 'tracking_log.db'
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024 # 16 Megabytes
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'txt'}
+    ALLOWED_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'txt'})
+
+    # Behind nginx, hand attachment downloads to it via X-Accel-Redirect instead of streaming them from Python.
+    # nginx must map the prefix onto UPLOAD_FOLDER, e.g.
+    #   location /_protected_uploads/ { internal; alias /path/to/uploads/; }
+    USE_X_ACCEL_REDIRECT = os.environ.get('USE_X_ACCEL_REDIRECT') == '1'
+    X_ACCEL_REDIRECT_PREFIX = '/_protected_uploads/'
+    # Behind Apache mod_xsendfile or lighttpd, Flask's send_file sets X-Sendfile to the file's path instead
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE') == '1'
 
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
-        print(f"Created upload folder: {UPLOAD_FOLDER}")
\ No newline at end of file
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True) # One mkdir syscall; safe when several workers boot at once
\ No newline at end of file
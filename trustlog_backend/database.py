@@ -1,60 +1,240 @@
 # trustlog_backend/database.py
 
+import logging
+import queue
 import sqlite3
-import os
+import threading
 from trustlog_backend.config import Config # Absolute import
 
 DATABASE_PATH = Config.DATABASE
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE_PATH)
+logger = logging.getLogger(__name__)
+
+# The connection the current thread is using, checked out of _pool on first use
+_local = threading.local()
+
+# Idle connections, PRAGMAs already applied. Requests check one out and the app-context teardown returns it, so
+# servers that start a thread per request (the dev server) reuse warm connections instead of opening new ones.
+# LIFO hands out the most recently used connection, whose page cache is hottest.
+_POOL_SIZE = 8
+_pool = queue.LifoQueue(maxsize=_POOL_SIZE)
+
+# SQLite allows a single writer at a time; serialize writes inside the process instead of hitting SQLITE_BUSY
+write_lock = threading.Lock()
+
+def _connect():
+    """Opens a new SQLite connection and applies the connection-level PRAGMAs once."""
+    # A larger statement cache keeps the compiled form of every query the app issues, so repeat calls skip parse/plan
+    # isolation_level=None: no implicit DEFERRED transactions; writers open theirs with begin_immediate()
+    conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False, cached_statements=256, isolation_level=None)
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA page_size=8192;') # Only takes effect when the database file is first created
     conn.execute('PRAGMA journal_mode=WAL;')
     conn.execute('PRAGMA synchronous=NORMAL;')
+    conn.execute('PRAGMA temp_store=MEMORY;')
+    conn.execute('PRAGMA cache_size=-65536;') # ~64 MB page cache
+    conn.execute('PRAGMA mmap_size=268435456;') # Read pages through a 256 MB memory map instead of pread()
+    conn.execute('PRAGMA wal_autocheckpoint=4000;') # Checkpoint less often on this write-heavy workload
+    conn.execute('PRAGMA busy_timeout=5000;') # Wait up to 5 s for another process's lock instead of failing at once
+    conn.execute('PRAGMA foreign_keys=ON;')
     return conn
 
+def get_db_connection():
+    """Returns the SQLite connection for the current thread, checking one out of the pool on first use.
+
+    Callers must not close it; release_db_connection() hands it back at the end of the app context.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            conn = _connect()
+        _local.conn = conn
+    return conn
+
+def begin_immediate(conn):
+    """Starts a write transaction that takes SQLite's write lock up front.
+
+    Acquiring the lock at BEGIN (rather than upgrading at the first write) makes contention surface before any
+    work is done. While another process holds the lock, busy_timeout makes SQLite wait up to 5 s before raising.
+    """
+    conn.execute('BEGIN IMMEDIATE;')
+
+def release_db_connection(exception=None):
+    """Teardown hook: returns the current thread's connection to the pool, closing it if the pool is full."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        return
+    _local.conn = None
+    if conn.in_transaction:
+        logger.warning("Rolling back a transaction left open by the request")
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+def close_db_connection():
+    """Closes the current thread's connection and every idle pooled one."""
+    release_db_connection()
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            return
+
+# Bump whenever init_db's DDL changes so existing databases pick the change up on next start
+SCHEMA_VERSION = 1
+
+# Timestamps are stored as INTEGER unix seconds; the routes format them back to text on output
+_UNIX_NOW = "(CAST(strftime('%s', 'now') AS INTEGER))"
+
+LOG_RECORDS_DDL = f'''
+    CREATE TABLE IF NOT EXISTS {{table}} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date_of_incident TEXT NOT NULL,
+        time_of_incident TEXT,
+        category TEXT NOT NULL,
+        description_of_incident TEXT NOT NULL,
+        impact_details TEXT,
+        supporting_evidence_snippet TEXT,
+        exhibit_reference TEXT,
+        created_at INTEGER NOT NULL DEFAULT {_UNIX_NOW}
+    )
+'''
+
+ATTACHMENTS_DDL = f'''
+    CREATE TABLE IF NOT EXISTS {{table}} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        log_record_id INTEGER NOT NULL,
+        filename TEXT NOT NULL,
+        stored_filename TEXT NOT NULL,
+        filepath TEXT NOT NULL,
+        filetype TEXT NOT NULL,
+        filesize_bytes INTEGER NOT NULL,
+        upload_date INTEGER NOT NULL DEFAULT {_UNIX_NOW},
+        FOREIGN KEY (log_record_id) REFERENCES log_records(id) ON DELETE CASCADE
+    )
+'''
+
+IMPACT_TYPES_DDL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        log_record_id INTEGER NOT NULL,
+        impact_type TEXT NOT NULL,
+        position INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (log_record_id, impact_type),
+        FOREIGN KEY (log_record_id) REFERENCES log_records(id) ON DELETE CASCADE
+    )
+'''
+
+# Idempotent DDL applied after the versioned steps; run one by one because executescript() would COMMIT
+# the BEGIN IMMEDIATE transaction the migration runs in
+SCHEMA_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL
+    )
+    ''',
+    # The default listing walks this in ORDER BY order (the implicit trailing rowid supplies the lr.id tie-break)
+    'CREATE INDEX IF NOT EXISTS idx_log_date_desc ON log_records (date_of_incident DESC, created_at DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_log_cat_date ON log_records (category, date_of_incident DESC)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_user_username ON users (username)',
+    'CREATE INDEX IF NOT EXISTS idx_impact_type ON log_record_impact_types (impact_type, log_record_id)',
+    # Hands each record's impact types over in position order, so the per-row read-back needs no sort
+    '''
+    CREATE INDEX IF NOT EXISTS idx_impact_type_position ON log_record_impact_types (
+        log_record_id, position, impact_type
+    )
+    ''',
+    # Covers the per-record attachment listing and counts, so they never touch the table rows
+    '''
+    CREATE INDEX IF NOT EXISTS idx_attachment_log_id ON attachments (
+        log_record_id, id, filename, stored_filename, filepath, filetype, filesize_bytes, upload_date
+    )
+    ''',
+    # download_attachment looks attachments up by their stored name
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_attachment_stored_filename ON attachments (stored_filename)',
+)
+
+def _rebuild_table(cursor, table, ddl, column_exprs=None):
+    """Recreates a table from its current DDL template and copies the rows across.
+
+    SQLite cannot change a column's type or a table's constraints in place, so copy into a new table and swap it in.
+    Columns the DDL no longer has are left behind; column_exprs maps column names to the SQL expression that
+    produces their new value. Indexes on the table are dropped with it; init_db recreates them afterwards.
+    """
+    old_columns = [row['name'] for row in cursor.execute(f'PRAGMA table_info({table});')]
+    cursor.execute(ddl.format(table=f'{table}_new'))
+    new_columns = {row['name'] for row in cursor.execute(f'PRAGMA table_info({table}_new);')}
+    column_names = [name for name in old_columns if name in new_columns]
+    columns = ', '.join(column_names)
+    converted = ', '.join((column_exprs or {}).get(name, name) for name in column_names)
+    cursor.execute(f'INSERT INTO {table}_new ({columns}) SELECT {converted} FROM {table};')
+    # Carry the AUTOINCREMENT high-water mark over so ids of deleted rows are never handed out again
+    sequence = cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+    cursor.execute(f'DROP TABLE {table};')
+    cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table};')
+    if sequence:
+        cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (sequence['seq'], table))
+
+def _unix_seconds(column):
+    """SQL converting a CURRENT_TIMESTAMP text column to unix seconds, falling back to now if it can't be parsed."""
+    return f"COALESCE(CAST(strftime('%s', {column}) AS INTEGER), {_UNIX_NOW})"
+
+def _migrate_original_tables(cursor):
+    """Converts log_records and attachments as the original, unversioned init_db created them.
+
+    Those keep impact types in a log_records.impact_types JSON column, store CURRENT_TIMESTAMP text and don't
+    cascade deletes to attachments. A new database was just created in the current form and is left alone.
+    """
+    columns = {row['name'] for row in cursor.execute('PRAGMA table_info(log_records);')}
+    if 'impact_types' not in columns:
+        return
+    # Each entry keeps its place in the submitted list, which is the order it is read back in
+    cursor.execute('''
+        INSERT OR IGNORE INTO log_record_impact_types (log_record_id, impact_type, position)
+        SELECT lr.id, je.value, je.key FROM log_records lr, json_each(lr.impact_types) je
+    ''')
+    # The rebuilds leave impact_types behind (the child table is the only copy now), convert the timestamps and add
+    # ON DELETE CASCADE. They also drop the original single-column indexes, which SCHEMA_DDL supersedes.
+    _rebuild_table(cursor, 'log_records', LOG_RECORDS_DDL, {'created_at': _unix_seconds('created_at')})
+    _rebuild_table(cursor, 'attachments', ATTACHMENTS_DDL, {'upload_date': _unix_seconds('upload_date')})
+
 def init_db():
-    """Initializes the database by creating tables if they don't exist."""
-    with get_db_connection() as conn:
+    """Initializes the database schema, skipping all DDL when it is already at SCHEMA_VERSION."""
+    conn = get_db_connection()
+    if conn.execute('PRAGMA user_version;').fetchone()[0] == SCHEMA_VERSION:
+        # Re-run ANALYZE only on tables whose statistics have drifted, so the planner keeps picking the list indexes
+        conn.execute('PRAGMA optimize;')
+        return
+
+    # The table rebuilds drop log_records while attachments still point at it; foreign_keys cannot change mid-transaction
+    conn.execute('PRAGMA foreign_keys=OFF;')
+    try:
+        _apply_migrations(conn)
+    finally:
+        conn.execute('PRAGMA foreign_keys=ON;')
+    logger.info("Database initialized at schema version %d", SCHEMA_VERSION)
+
+def _apply_migrations(conn):
+    """Brings the schema up to SCHEMA_VERSION inside one write transaction."""
+    with write_lock, conn:
+        begin_immediate(conn)
+        # Another worker may have finished the migration while this one waited for the write lock
+        version = conn.execute('PRAGMA user_version;').fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
         cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS log_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date_of_incident TEXT NOT NULL,
-                time_of_incident TEXT,
-                category TEXT NOT NULL,
-                description_of_incident TEXT NOT NULL,
-                impact_types TEXT NOT NULL,
-                impact_details TEXT,
-                supporting_evidence_snippet TEXT,
-                exhibit_reference TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS attachments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                log_record_id INTEGER NOT NULL,
-                filename TEXT NOT NULL,
-                stored_filename TEXT NOT NULL,
-                filepath TEXT NOT NULL,
-                filetype TEXT NOT NULL,
-                filesize_bytes INTEGER NOT NULL,
-                upload_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (log_record_id) REFERENCES log_records(id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL
-            )
-        ''')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_log_date ON log_records (date_of_incident);')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_log_category ON log_records (category);')
-        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_user_username ON users (username);')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attachment_log_id ON attachments (log_record_id);') # Ensure this index is also present
-        conn.commit()
-    print("Database initialized or already exists.")
\ No newline at end of file
+        cursor.execute(LOG_RECORDS_DDL.format(table='log_records'))
+        cursor.execute(ATTACHMENTS_DDL.format(table='attachments'))
+        cursor.execute(IMPACT_TYPES_DDL.format(table='log_record_impact_types'))
+        if version < 1:
+            _migrate_original_tables(cursor)
+        for statement in SCHEMA_DDL:
+            cursor.execute(statement)
+        # Refresh planner statistics so the new indexes are picked over table scans
+        cursor.execute('ANALYZE;')
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION};')
@@ -0,0 +1,24 @@
+# trustlog_backend/gunicorn.conf.py
+#
+#   gunicorn -c trustlog_backend/gunicorn.conf.py trustlog_backend.wsgi:app
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# One process per core. Requests inside a worker run on real threads, so a slow upload only ties up its own thread.
+# gevent is not used: sqlite3 calls block in C without yielding, and the per-thread connections and write_lock
+# assume real threads
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Each worker imports the app itself, so no SQLite connection is opened before the fork and shared across processes
+preload_app = False
+
+# Uploads are capped at 16 MB; give slow clients time to send them
+timeout = 120
+
+# Without a proxy in front, attachment downloads leave through wsgi.file_wrapper; send those with sendfile(2)
+sendfile = True
@@ -1,8 +1,27 @@
 # trustlog_backend/models.py
 
+import threading
+import time
 from flask_login import UserMixin
 from trustlog_backend.database import get_db_connection # Absolute import
 
+SELECT_USER_BY_ID_SQL = "SELECT id, username, password_hash FROM users WHERE id = ?"
+SELECT_USER_BY_USERNAME_SQL = "SELECT id, username, password_hash FROM users WHERE username = ?"
+
+# Flask-Login loads the user on every authenticated request; remember found users briefly instead of re-querying.
+# Only hits are cached, so a newly registered user is never shadowed by a stale miss.
+_USER_CACHE_TTL = 60 # seconds
+_USER_CACHE_MAX = 1024
+_user_cache = {} # str(user_id) -> (expires_at, User)
+_user_cache_lock = threading.Lock()
+
+def _cache_user(user):
+    with _user_cache_lock:
+        if len(_user_cache) >= _USER_CACHE_MAX:
+            _user_cache.clear()
+        _user_cache[user.get_id()] = (time.monotonic() + _USER_CACHE_TTL, user)
+    return user
+
 class User(UserMixin):
     def __init__(self, id, username, password_hash):
         self.id = id
@@ -14,18 +33,20 @@ class User(UserMixin):
 
     @staticmethod
     def get(user_id):
+        cached = _user_cache.get(str(user_id))
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
         conn = get_db_connection()
-        user_data = conn.execute("SELECT id, username, password_hash FROM users WHERE id = ?", (user_id,)).fetchone()
-        conn.close()
+        user_data = conn.execute(SELECT_USER_BY_ID_SQL, (user_id,)).fetchone()
         if user_data:
-            return User(user_data['id'], user_data['username'], user_data['password_hash'])
+            return _cache_user(User(user_data['id'], user_data['username'], user_data['password_hash']))
         return None
 
     @staticmethod
     def get_by_username(username):
         conn = get_db_connection()
-        user_data = conn.execute("SELECT id, username, password_hash FROM users WHERE username = ?", (username,)).fetchone()
-        conn.close()
+        user_data = conn.execute(SELECT_USER_BY_USERNAME_SQL, (username,)).fetchone()
         if user_data:
-            return User(user_data['id'], user_data['username'], user_data['password_hash'])
-        return None
\ No newline at end of file
+            # Login always reads the row fresh, then primes the cache for the requests that follow
+            return _cache_user(User(user_data['id'], user_data['username'], user_data['password_hash']))
+        return None
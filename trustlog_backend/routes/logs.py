@@ -4,407 +4,594 @@ from flask import Blueprint, request, jsonify, send_from_directory, current_app
 from flask_login import login_required
 import sqlite3
 import os
-import json
-from datetime import datetime
-import uuid
-from werkzeug.utils import secure_filename
+import base64
+import itertools
+import mimetypes
+import unicodedata
+from urllib.parse import quote as url_quote
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+import time
 
 # Corrected imports: Import Config class, not its attributes directly
-from trustlog_backend.database import get_db_connection
-from trustlog_backend.config import Config, UPLOAD_FOLDER # Keep UPLOAD_FOLDER as it's directly used in this file
-from trustlog_backend.allowed_file import allowed_file # Corrected: Absolute import
+from trustlog_backend.database import get_db_connection, begin_immediate, write_lock
+from trustlog_backend.config import Config
+from trustlog_backend.allowed_file import allowed_extension, allowed_extensions_response # Corrected: Absolute import
 
 logs_bp = Blueprint('logs', __name__)
 
+# Statement text is kept constant so sqlite3's per-connection statement cache always hits
+# RETURNING hands back the new id in the INSERT's own result row (SQLite >= 3.35)
+INSERT_LOG_SQL = """
+    INSERT INTO log_records (
+        date_of_incident, time_of_incident, category, description_of_incident,
+        impact_details, supporting_evidence_snippet, exhibit_reference
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    RETURNING id
+"""
+
+# Form fields stored on the log_records row, in INSERT_LOG_SQL column order; impact_types goes to its own table
+LOG_FIELDS = (
+    'date_of_incident', 'time_of_incident', 'category', 'description_of_incident',
+    'impact_details', 'supporting_evidence_snippet', 'exhibit_reference'
+)
+
+UPDATE_LOG_SQL = f"""
+    UPDATE log_records SET {', '.join(f'{field} = ?' for field in LOG_FIELDS)}
+    WHERE id = ?
+"""
+
+# Fields every log record must carry a non-empty value for
+REQUIRED_LOG_FIELDS = ('date_of_incident', 'category', 'description_of_incident', 'impact_types')
+
+# Timestamps are stored as unix seconds; render them in the same UTC text form CURRENT_TIMESTAMP used to produce
+# impact_types is aggregated from the child table into JSON text that is spliced into the response as-is
+# (see _log_record_dict). The subquery reads idx_impact_type_position, so rows reach json_group_array already in
+# position order without a sort; SQLite 3.40 has no ORDER BY inside aggregates.
+LOG_RECORD_COLUMNS = """
+    lr.id, lr.date_of_incident, lr.time_of_incident, lr.category, lr.description_of_incident,
+    (SELECT json_group_array(impact_type) FROM (
+        SELECT impact_type FROM log_record_impact_types WHERE log_record_id = lr.id ORDER BY position
+    )) AS impact_types,
+    lr.impact_details, lr.supporting_evidence_snippet, lr.exhibit_reference,
+    datetime(lr.created_at, 'unixepoch') AS created_at
+"""
+
+SELECT_LOG_RECORD_SQL = f"SELECT {LOG_RECORD_COLUMNS} FROM log_records lr WHERE lr.id = ?"
+
+# SQLite renders the attachment list as the JSON response body itself. Keys are listed alphabetically to match
+# jsonify's sort_keys output, and rows come in id order, as the covering idx_attachment_log_id yields them.
+SELECT_ATTACHMENTS_JSON_SQL = """
+    SELECT json_group_array(json_object(
+        'filename', filename, 'filepath', filepath, 'filesize_bytes', filesize_bytes, 'filetype', filetype,
+        'id', id, 'log_record_id', log_record_id, 'stored_filename', stored_filename,
+        'upload_date', datetime(upload_date, 'unixepoch')
+    )) FROM (SELECT * FROM attachments WHERE log_record_id = ? ORDER BY id)
+"""
+
+# Optional list filters, in the order their parameters are bound
+LIST_FILTERS = (
+    ('category', "lr.category = ?"),
+    ('start_date', "lr.date_of_incident >= ?"),
+    ('end_date', "lr.date_of_incident <= ?"),
+    ('impact_type', "lr.id IN (SELECT log_record_id FROM log_record_impact_types WHERE impact_type = ?)"),
+)
+VALID_SORT_COLUMNS = ('date_of_incident', 'category', 'created_at')
+VALID_SORT_ORDERS = ('ASC', 'DESC')
+
+# Optional paging: ?limit=N returns at most N rows, and a full page names the next one in this header
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+MAX_LIST_LIMIT = 1000
+
+def _keyset_condition(sort_by, sort_order):
+    """Selects the rows after a cursor's (sort value, created_at, id) in the list's ORDER BY order.
+
+    The leading inclusive range on the sort column is redundant but lets SQLite seek its index instead of
+    walking the rows before the cursor. Cursors carry created_at as rendered (UTC text), so it is converted back.
+    """
+    created_at = "CAST(strftime('%s', ?) AS INTEGER)"
+    sort_value = created_at if sort_by == 'created_at' else '?'
+    op = '<' if sort_order == 'DESC' else '>'
+    return (
+        f"lr.{sort_by} {op}= {sort_value} AND (lr.{sort_by} {op} {sort_value}"
+        f" OR lr.created_at < {created_at} OR (lr.created_at = {created_at} AND lr.id > ?))"
+    )
+
+def _list_log_records_sql(active_filters, sort_by, sort_order, after_cursor):
+    # A correlated count served by idx_attachment_log_id avoids grouping the whole join in a temp b-tree
+    query = f"""
+        SELECT {LOG_RECORD_COLUMNS},
+            (SELECT COUNT(*) FROM attachments a WHERE a.log_record_id = lr.id) AS attachment_count
+        FROM log_records lr
+    """
+    conditions = [condition for (_, condition), active in zip(LIST_FILTERS, active_filters) if active]
+    if after_cursor:
+        conditions.append(_keyset_condition(sort_by, sort_order))
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    # LIMIT is always bound; -1 means no limit, so unpaged requests share the statement text
+    return query + where + f" ORDER BY lr.{sort_by} {sort_order}, lr.created_at DESC, lr.id LIMIT ?"
+
+# Every filter/sort/cursor combination is built once, so requests reuse identical text and hit the statement cache
+LIST_LOG_RECORDS_SQL = {
+    (active_filters, sort_by, sort_order, after_cursor): _list_log_records_sql(
+        active_filters, sort_by, sort_order, after_cursor
+    )
+    for active_filters in itertools.product((False, True), repeat=len(LIST_FILTERS))
+    for sort_by in VALID_SORT_COLUMNS
+    for sort_order in VALID_SORT_ORDERS
+    for after_cursor in (False, True)
+}
+
+INSERT_IMPACT_TYPE_SQL = """
+    INSERT OR IGNORE INTO log_record_impact_types (log_record_id, impact_type, position) VALUES (?, ?, ?)
+"""
+
+INSERT_ATTACHMENT_SQL = """
+    INSERT INTO attachments (
+        log_record_id, filename, stored_filename, filepath, filetype, filesize_bytes
+    ) VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+DELETE_IMPACT_TYPES_SQL = "DELETE FROM log_record_impact_types WHERE log_record_id = ?"
+
+DELETE_LOG_RECORD_SQL = "DELETE FROM log_records WHERE id = ?"
+
+DELETE_LOG_ATTACHMENTS_SQL = "DELETE FROM attachments WHERE log_record_id = ? RETURNING filepath, stored_filename"
+
+DELETE_ATTACHMENT_SQL = "DELETE FROM attachments WHERE id = ? RETURNING filepath, stored_filename"
+
+SELECT_ATTACHMENT_BY_STORED_FILENAME_SQL = (
+    "SELECT filename, stored_filename, filepath FROM attachments WHERE stored_filename = ?"
+)
+
+_MISSING_FIELD_ERROR = "Missing or empty required field: {}"
+_IMPACT_TYPES_NOT_JSON_ERROR = "impact_types must be a valid JSON array string"
+_IMPACT_TYPES_NOT_LIST_ERROR = "impact_types must be a valid JSON array"
+_IMPACT_TYPES_NOT_STRINGS_ERROR = "impact_types must contain only strings"
+
+# The form validation errors come from a small fixed set, so their JSON bodies are encoded once at import
+_VALIDATION_ERROR_BODIES = {
+    message: orjson.dumps({"error": message}, option=orjson.OPT_APPEND_NEWLINE)
+    for message in (
+        *(_MISSING_FIELD_ERROR.format(field) for field in REQUIRED_LOG_FIELDS),
+        _IMPACT_TYPES_NOT_JSON_ERROR,
+        _IMPACT_TYPES_NOT_LIST_ERROR,
+        _IMPACT_TYPES_NOT_STRINGS_ERROR,
+    )
+}
+
+def _error_response(message, status):
+    """Builds a JSON error response, reusing the pre-encoded body for known validation errors."""
+    body = _VALIDATION_ERROR_BODIES.get(message)
+    if body is None:
+        return jsonify({"error": message}), status
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+# Unlinking files is unrelated to the DB transaction, so deletes hand it off and respond once they have committed
+_file_cleanup_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='attachment-cleanup')
+
+_UPLOAD_CHUNK_SIZE = 1 << 20
+
+def _uuid7_hex():
+    """Returns a time-ordered UUIDv7 (RFC 9562) as 32 hex digits.
+
+    Names minted close together sort together, so new stored_filename entries land on the same index pages.
+    """
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), 'big')
+    value = value & ~(0xF << 76) | 0x7 << 76 # version 7
+    value = value & ~(0x3 << 62) | 0x2 << 62 # RFC 9562 variant
+    return f'{value:032x}'
+
+def _save_upload(file, out):
+    """Copies an upload into the open file out in 1 MB chunks and returns its size, so no stat() is needed after."""
+    filesize_bytes = 0
+    with out:
+        while chunk := file.stream.read(_UPLOAD_CHUNK_SIZE):
+            out.write(chunk)
+            filesize_bytes += len(chunk)
+    return filesize_bytes
+
+def _save_uploads(files, not_allowed_error, saved_paths):
+    """Validates and writes uploaded files, returning each one's attachment row without its log_record_id.
+
+    Every extension is checked before any file is written. Paths are added to saved_paths before their file is
+    written, so the caller can remove partial uploads if a later step fails.
+    """
+    files = [file for file in files if file.filename != ''] # Skip empty file parts
+    # The validated extension is reused for the stored name
+    extensions = [allowed_extension(file.filename) for file in files]
+    for file, file_extension in zip(files, extensions):
+        if file_extension is None:
+            raise ValueError(not_allowed_error.format(file.filename))
+
+    attachments = []
+    for file, file_extension in zip(files, extensions):
+        file_id = _uuid7_hex()
+        unique_filename = f"{file_id}.{file_extension}"
+
+        # Shard by the id's random trailing hex pairs (uploads/ab/cd/...) so no directory grows without bound;
+        # the leading digits are the timestamp and would put every recent upload in one directory
+        shard_path = os.path.join(file_id[-2:], file_id[-4:-2])
+        destination_dir = os.path.join(Config.UPLOAD_FOLDER, shard_path)
+        full_filepath_on_disk = os.path.join(destination_dir, unique_filename)
+        saved_paths.append(full_filepath_on_disk) # Listed first, in case the save fails partway
+
+        # Shard directories are never pruned, so once created it stays; later uploads' makedirs is a no-op mkdir
+        os.makedirs(destination_dir, exist_ok=True)
+        filesize_bytes = _save_upload(file, open(full_filepath_on_disk, 'wb'))
+
+        attachments.append((
+            file.filename, unique_filename,
+            os.path.join(shard_path, unique_filename), # Store relative path
+            file.content_type, filesize_bytes
+        ))
+    return attachments
+
+def _remove_saved_files(paths):
+    """Deletes files written for a request that then failed."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def _is_empty_dir(path):
+    """Checks emptiness by reading at most one directory entry instead of listing them all."""
+    with os.scandir(path) as entries:
+        return next(entries, None) is None
+
+def _remove_attachment_files(relative_paths, logger):
+    """Deletes attachment files, then prunes the legacy YYYY/MM directories they leave empty. Runs on the cleanup executor.
+
+    Shard directories (uploads/ab/cd) are a fixed set of at most 65,536 that keep being reused, so they are left in
+    place; pruning them would race another worker's upload between its makedirs and open. Nothing writes to the
+    YYYY/MM layout any more, so emptying those cannot race an upload.
+    """
+    legacy_dirs = set()
+    for relative_path in relative_paths:
+        full_filepath = os.path.join(Config.UPLOAD_FOLDER, relative_path)
+        try:
+            os.remove(full_filepath)
+            logger.info("Deleted attachment file: %s", full_filepath)
+        except FileNotFoundError:
+            pass # Already gone, e.g. a concurrent delete got there first
+        except OSError as e:
+            logger.error("Error deleting file %s: %s", full_filepath, e)
+            continue
+        year, month = os.path.normpath(relative_path).split(os.sep)[:2]
+        if len(year) == 4: # A shard's top level is two hex digits
+            legacy_dirs.add(os.path.join(Config.UPLOAD_FOLDER, year, month))
+            legacy_dirs.add(os.path.join(Config.UPLOAD_FOLDER, year))
+
+    # Each directory is checked once however many of its files went; deepest first, so parents see their children gone
+    for directory in sorted(legacy_dirs, key=len, reverse=True):
+        try:
+            if not _is_empty_dir(directory):
+                continue
+            os.rmdir(directory)
+            logger.info("Removed empty directory: %s", directory)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error("Error removing directory %s: %s", directory, e)
+
+def _encode_list_cursor(record, sort_by):
+    """Opaque next-page cursor: the last row's sort value, created_at and id, as base64url JSON."""
+    return base64.urlsafe_b64encode(orjson.dumps([record[sort_by], record['created_at'], record['id']])).decode()
+
+def _decode_list_cursor(token):
+    """Inverse of _encode_list_cursor, returned as the keyset condition's parameters. Raises ValueError if malformed."""
+    try:
+        sort_value, created_at, last_id = orjson.loads(base64.urlsafe_b64decode(token))
+    except (TypeError, ValueError): # binascii.Error and orjson.JSONDecodeError are ValueErrors
+        raise ValueError("Invalid cursor")
+    if not (isinstance(sort_value, str) and isinstance(created_at, str) and isinstance(last_id, int)):
+        raise ValueError("Invalid cursor")
+    return [sort_value, sort_value, created_at, created_at, last_id]
+
+def _download_name_options(download_name):
+    """Content-Disposition filename parameters, with an RFC 2231 fallback for non-ASCII names (as send_file does)."""
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{url_quote(download_name, safe='!#$&+^`|~')}"}
+    return {'filename': download_name}
+
+def _log_record_dict(row):
+    """Converts a LOG_RECORD_COLUMNS row (or its name/value pairs) into its response dict without decoding impact_types."""
+    record_dict = dict(row)
+    # Already valid JSON, so orjson writes it verbatim instead of parsing and re-encoding the list
+    record_dict['impact_types'] = orjson.Fragment(record_dict['impact_types'])
+    return record_dict
+
+def _log_record_values(data):
+    """Validates log record form fields.
+
+    Returns the INSERT_LOG_SQL parameters (in column order) and the parsed impact_types list.
+
+    Raises ValueError with a client-facing message when a field is missing or malformed.
+    """
+    # Read each form field once; the dict keeps LOG_FIELDS order, which is the column order
+    fields = {name: data.get(name) for name in LOG_FIELDS}
+    fields['impact_types'] = data.get('impact_types')
+
+    # Server-side validation for mandatory text fields
+    missing = next((field for field in REQUIRED_LOG_FIELDS if not fields[field]), None)
+    if missing:
+        raise ValueError(_MISSING_FIELD_ERROR.format(missing))
+
+    # Parse impact_types from JSON string (sent by FormData); it is stored in log_record_impact_types, not the row
+    try:
+        impact_types = orjson.loads(fields.pop('impact_types'))
+    except orjson.JSONDecodeError:
+        raise ValueError(_IMPACT_TYPES_NOT_JSON_ERROR)
+    if not isinstance(impact_types, list):
+        raise ValueError(_IMPACT_TYPES_NOT_LIST_ERROR)
+    # Each entry becomes a log_record_impact_types row, which only takes text
+    if not all(isinstance(impact_type, str) for impact_type in impact_types):
+        raise ValueError(_IMPACT_TYPES_NOT_STRINGS_ERROR)
+
+    if fields['supporting_evidence_snippet'] == 'null': # Frontend might send "null" string
+        fields['supporting_evidence_snippet'] = None
+    return tuple(fields.values()), impact_types
+
+@logs_bp.before_request
+def reject_oversized_body():
+    """Turns away bodies over MAX_CONTENT_LENGTH from their Content-Length header, before any handler reads them.
+
+    Otherwise the write handlers only find out when request.form is parsed, inside their error handling, and the
+    RequestEntityTooLarge surfaces as a 500.
+    """
+    limit = request.max_content_length
+    if limit is not None and request.content_length is not None and request.content_length > limit:
+        return jsonify({"error": f"Request body too large; the limit is {limit} bytes"}), 413
+
 @logs_bp.route('/', methods=['POST'])
 @login_required
 def create_log_record():
-    conn = None
     temp_saved_files = [] # Keep track of files saved to disk for cleanup on rollback
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        conn.execute('BEGIN TRANSACTION;') # Start a transaction
-
-        # Parse form data
-        data = request.form
+        # Parse and validate form data before any lock is taken: reading request.form pulls the whole body off
+        # the socket, and SQLite's write lock blocks every process while it is held. Raises ValueError for a
+        # custom error response
+        values, impact_types = _log_record_values(request.form)
         files = request.files.getlist('files') # Get list of all files with 'files' field name
 
-        # Server-side validation for mandatory text fields
-        required_fields = ['date_of_incident', 'category', 'description_of_incident', 'impact_types']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                # Raise ValueError to trigger rollback and custom error response
-                raise ValueError(f"Missing or empty required field: {field}")
+        # Files go to disk before the lock and transaction are taken, so both only span the SQL
+        attachments = _save_uploads(files, "File type not allowed for: {}", temp_saved_files)
 
-        # Parse impact_types from JSON string (sent by FormData)
-        impact_types_json_str = data.get('impact_types')
-        try:
-            impact_types = json.loads(impact_types_json_str) if impact_types_json_str else []
-            if not isinstance(impact_types, list):
-                raise ValueError("impact_types must be a valid JSON array")
-        except json.JSONDecodeError:
-            raise ValueError("impact_types must be a valid JSON array string")
-
-        date_of_incident = data.get('date_of_incident')
-        time_of_incident = data.get('time_of_incident', None)
-        category = data.get('category')
-        description_of_incident = data.get('description_of_incident')
-        impact_details = data.get('impact_details', None)
-        supporting_evidence_snippet = data.get('supporting_evidence_snippet', None)
-        if supporting_evidence_snippet == 'null': # Frontend might send "null" string
-            supporting_evidence_snippet = None
-        exhibit_reference = data.get('exhibit_reference', None)
-
-        # Insert log record
-        cursor.execute(
-            """
-            INSERT INTO log_records (
-                date_of_incident, time_of_incident, category, description_of_incident,
-                impact_types, impact_details, supporting_evidence_snippet, exhibit_reference
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                date_of_incident, time_of_incident, category, description_of_incident,
-                json.dumps(impact_types), impact_details, supporting_evidence_snippet, exhibit_reference
-            )
-        )
-        log_id = cursor.lastrowid
-
-        # Handle file uploads if any
-        for file in files:
-            if file.filename == '':
-                continue # Skip empty file parts
-
-            if not allowed_file(file.filename): # Use allowed_file helper
-                raise ValueError(f"File type not allowed for: {file.filename}")
-
-            original_filename = file.filename
-            secured_filename = secure_filename(original_filename)
-            file_extension = secured_filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{uuid.uuid4()}.{file_extension}"
-
-            today_path = datetime.now().strftime("%Y/%m")
-            # Access UPLOAD_FOLDER from Config.UPLOAD_FOLDER
-            destination_dir = os.path.join(Config.UPLOAD_FOLDER, today_path)
-            # Ensure destination directory exists before saving
-            if not os.path.exists(destination_dir):
-                os.makedirs(destination_dir)
-
-            full_filepath_on_disk = os.path.join(destination_dir, unique_filename)
-            
-            file.save(full_filepath_on_disk) # Save physical file
-            temp_saved_files.append(full_filepath_on_disk) # Add to cleanup list
-
-            filesize_bytes = os.path.getsize(full_filepath_on_disk)
-
-            # Insert attachment metadata
-            cursor.execute(
-                """
-                INSERT INTO attachments (
-                    log_record_id, filename, stored_filename, filepath, filetype, filesize_bytes
-                ) VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    log_id, original_filename, unique_filename,
-                    os.path.join(today_path, unique_filename), # Store relative path
-                    file.content_type, filesize_bytes
-                )
-            )
-
-        conn.commit() # Commit transaction if everything successful
+        conn = get_db_connection()
+        with write_lock, conn: # Single writer per process; commits on success, rolls back on any exception
+            cursor = conn.cursor()
+            begin_immediate(conn) # Start a transaction
+
+            # Insert log record
+            log_id = cursor.execute(INSERT_LOG_SQL, values).fetchone()[0]
+            cursor.executemany(INSERT_IMPACT_TYPE_SQL, [
+                (log_id, impact_type, position) for position, impact_type in enumerate(impact_types)
+            ])
+            # Insert all attachment metadata in one call
+            cursor.executemany(INSERT_ATTACHMENT_SQL, [(log_id, *attachment) for attachment in attachments])
         return jsonify({"message": "Log record and attachments created successfully", "id": log_id}), 201
 
     except (ValueError, sqlite3.Error) as e:
-        if conn: conn.execute('ROLLBACK;') # Rollback DB transaction on error
-        for fpath in temp_saved_files: # Clean up physical files
-            if os.path.exists(fpath):
-                os.remove(fpath)
-        current_app.logger.error(f"Error during combined record/attachment creation: {e}")
+        _remove_saved_files(temp_saved_files) # Clean up physical files
+        current_app.logger.error("Error during combined record/attachment creation: %s", e)
         # Return 400 for validation errors, 500 for DB errors
-        return jsonify({"error": str(e)}), 400 if isinstance(e, ValueError) else 500
+        return _error_response(str(e), 400 if isinstance(e, ValueError) else 500)
     except Exception as e:
-        if conn: conn.execute('ROLLBACK;') # Rollback DB transaction on error
-        for fpath in temp_saved_files: # Clean up physical files
-            if os.path.exists(fpath):
-                os.remove(fpath)
-        current_app.logger.error(f"An unexpected error occurred during combined record/attachment creation: {e}")
+        _remove_saved_files(temp_saved_files) # Clean up physical files
+        current_app.logger.exception("An unexpected error occurred during combined record/attachment creation")
         return jsonify({"error": "An unexpected server error occurred during record creation", "details": str(e)}), 500
-    finally:
-        if conn: conn.close()
+
+
+@logs_bp.route('/bulk', methods=['POST'])
+@login_required
+def create_log_records_bulk():
+    """Creates many log records (without attachments) in one transaction, so a burst pays for a single commit."""
+    records = request.get_json(silent=True)
+    if not isinstance(records, list) or not records:
+        return jsonify({"error": "Request body must be a non-empty JSON array of log records"}), 400
+
+    rows = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            return jsonify({"error": f"Record {index} must be a JSON object"}), 400
+        # Only absent, null or '' counts as missing, so an empty impact_types list is accepted like the form's '[]'
+        missing = next((field for field in REQUIRED_LOG_FIELDS if record.get(field) in (None, '')), None)
+        if missing:
+            return jsonify({"error": f"Record {index}: Missing or empty required field: {missing}"}), 400
+        # The columns are text; anything else would only fail later as a binding error
+        wrong_type = next((field for field in LOG_FIELDS if not isinstance(record.get(field), (str, type(None)))), None)
+        if wrong_type:
+            return jsonify({"error": f"Record {index}: {wrong_type} must be a string or null"}), 400
+        impact_types = record['impact_types']
+        if not isinstance(impact_types, list):
+            return jsonify({"error": f"Record {index}: impact_types must be a JSON array"}), 400
+        if not all(isinstance(impact_type, str) for impact_type in impact_types):
+            return jsonify({"error": f"Record {index}: {_IMPACT_TYPES_NOT_STRINGS_ERROR}"}), 400
+
+        rows.append(tuple(record.get(field) for field in LOG_FIELDS))
+
+    try:
+        conn = get_db_connection()
+        with write_lock, conn:
+            cursor = conn.cursor()
+            begin_immediate(conn)
+            # executemany discards RETURNING rows, so insert one by one; the statement is compiled once either way
+            log_ids = [cursor.execute(INSERT_LOG_SQL, row).fetchone()[0] for row in rows]
+            cursor.executemany(INSERT_IMPACT_TYPE_SQL, [
+                (log_id, impact_type, position)
+                for log_id, record in zip(log_ids, records)
+                for position, impact_type in enumerate(record['impact_types'])
+            ])
+        return jsonify({"message": f"{len(rows)} log records created successfully", "ids": log_ids}), 201
+    except sqlite3.Error as e:
+        current_app.logger.error("Database error during bulk record creation: %s", e)
+        return jsonify({"error": "Could not create log records", "details": str(e)}), 500
 
 
 @logs_bp.route('/', methods=['GET'])
 @login_required
 def get_log_records():
-    conn = None
     try:
         conn = get_db_connection()
-        category_filter = request.args.get('category')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        filter_values = [request.args.get(name) for name, _ in LIST_FILTERS]
         sort_by = request.args.get('sort_by', 'date_of_incident')
         sort_order = request.args.get('sort_order', 'desc').upper()
 
-        valid_sort_columns = ['date_of_incident', 'category', 'created_at']
-        if sort_by not in valid_sort_columns:
+        if sort_by not in VALID_SORT_COLUMNS:
             return jsonify({"error": f"Invalid sort_by column: {sort_by}"}), 400
 
-        if sort_order not in ['ASC', 'DESC']:
+        if sort_order not in VALID_SORT_ORDERS:
             return jsonify({"error": f"Invalid sort_order: {sort_order}"}), 400
 
-        query = """
-            SELECT lr.*, COUNT(a.id) AS attachment_count
-            FROM log_records lr
-            LEFT JOIN attachments a ON lr.id = a.log_record_id
-            WHERE 1=1
-        """
-        params = []
-
-        if category_filter:
-            query += " AND lr.category = ?"
-            params.append(category_filter)
-
-        if start_date:
-            query += " AND lr.date_of_incident >= ?"
-            params.append(start_date)
+        limit = request.args.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0 # Fails the range check below
+            if not 1 <= limit <= MAX_LIST_LIMIT:
+                return jsonify({"error": f"limit must be an integer from 1 to {MAX_LIST_LIMIT}"}), 400
 
-        if end_date:
-            query += " AND lr.date_of_incident <= ?"
-            params.append(end_date)
+        active_filters = tuple(bool(value) for value in filter_values)
+        params = [value for value in filter_values if value]
 
-        query += f" GROUP BY lr.id ORDER BY lr.{sort_by} {sort_order}, lr.created_at DESC"
+        after_token = request.args.get('cursor')
+        if after_token:
+            try:
+                params += _decode_list_cursor(after_token)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        params.append(limit or -1)
 
         cursor = conn.cursor()
-        cursor.execute(query, params)
-        log_records = cursor.fetchall()
-
-        records_list = []
-        for record in log_records:
-            record_dict = dict(record)
-            if record_dict['impact_types']:
-                record_dict['impact_types'] = json.loads(record_dict['impact_types'])
-            else:
-                record_dict['impact_types'] = []
-            records_list.append(record_dict)
-
-        return jsonify(records_list), 200
+        cursor.row_factory = None # Plain tuples; column names are zipped on from one description lookup
+        cursor.execute(LIST_LOG_RECORDS_SQL[active_filters, sort_by, sort_order, bool(after_token)], params)
+        columns = tuple(column[0] for column in cursor.description)
+
+        records = [_log_record_dict(zip(columns, row)) for row in cursor.fetchall()]
+        response = jsonify(records)
+        # The body stays a plain array; a full page tells the client where the next one starts
+        if limit and len(records) == limit:
+            response.headers[NEXT_CURSOR_HEADER] = _encode_list_cursor(records[-1], sort_by)
+        return response, 200
     except Exception as e:
-        current_app.logger.error(f"An unexpected error occurred during log record retrieval: {e}")
+        current_app.logger.exception("An unexpected error occurred during log record retrieval")
         return jsonify({"error": "An unexpected server error occurred during record retrieval", "details": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @logs_bp.route('/<int:log_id>', methods=['GET'])
 @login_required
 def get_log_record_by_id(log_id):
-    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM log_records WHERE id = ?", (log_id,))
+        cursor.execute(SELECT_LOG_RECORD_SQL, (log_id,))
         record = cursor.fetchone()
 
         if record is None:
             return jsonify({"error": "Log record not found"}), 404
 
-        record_dict = dict(record)
-        if record_dict['impact_types']:
-            record_dict['impact_types'] = json.loads(record_dict['impact_types'])
-        else:
-            record_dict['impact_types'] = []
-
-        return jsonify(record_dict), 200
+        return jsonify(_log_record_dict(record)), 200
     except Exception as e:
-        current_app.logger.error(f"An unexpected error occurred during single log record retrieval: {e}")
+        current_app.logger.exception("An unexpected error occurred during single log record retrieval")
         return jsonify({"error": "An unexpected server error occurred during record retrieval", "details": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @logs_bp.route('/<int:log_id>', methods=['PUT'])
 @login_required
 def update_log_record(log_id):
-    conn = None
     temp_saved_files = [] # For cleanup on rollback
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        conn.execute('BEGIN TRANSACTION;')
-
-        cursor.execute("SELECT id FROM log_records WHERE id = ?", (log_id,))
-        if cursor.fetchone() is None:
-            conn.execute('ROLLBACK;')
-            return jsonify({"error": "Log record not found"}), 404
-
-        data = request.form
+        # As in create_log_record, the body is read and the files written before any lock is taken
+        values, impact_types = _log_record_values(request.form)
         new_files = request.files.getlist('files')
 
-        required_fields = ['date_of_incident', 'category', 'description_of_incident', 'impact_types']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                raise ValueError(f"Missing or empty required field: {field}")
+        attachments = _save_uploads(new_files, "File type not allowed for new attachment: {}", temp_saved_files)
 
-        impact_types_json_str = data.get('impact_types')
-        try:
-            impact_types = json.loads(impact_types_json_str) if impact_types_json_str else []
-            if not isinstance(impact_types, list):
-                raise ValueError("impact_types must be a valid JSON array")
-        except json.JSONDecodeError:
-            raise ValueError("impact_types must be a valid JSON array string")
-
-        date_of_incident = data.get('date_of_incident')
-        time_of_incident = data.get('time_of_incident', None)
-        category = data.get('category')
-        description_of_incident = data.get('description_of_incident')
-        impact_details = data.get('impact_details', None)
-        supporting_evidence_snippet = data.get('supporting_evidence_snippet', None)
-        if supporting_evidence_snippet == 'null':
-            supporting_evidence_snippet = None
-        exhibit_reference = data.get('exhibit_reference', None)
-
-        cursor.execute(
-            """
-            UPDATE log_records SET
-                date_of_incident = ?,
-                time_of_incident = ?,
-                category = ?,
-                description_of_incident = ?,
-                impact_types = ?,
-                impact_details = ?,
-                supporting_evidence_snippet = ?,
-                exhibit_reference = ?
-            WHERE id = ?
-            """,
-            (
-                date_of_incident, time_of_incident, category, description_of_incident,
-                json.dumps(impact_types), impact_details, supporting_evidence_snippet, exhibit_reference,
-                log_id
-            )
-        )
-
-        for file in new_files:
-            if file.filename == '':
-                continue
-
-            if not allowed_file(file.filename):
-                raise ValueError(f"File type not allowed for new attachment: {file.filename}")
-
-            original_filename = file.filename
-            secured_filename = secure_filename(original_filename)
-            file_extension = secured_filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{uuid.uuid4()}.{file_extension}"
-
-            today_path = datetime.now().strftime("%Y/%m")
-            destination_dir = os.path.join(Config.UPLOAD_FOLDER, today_path)
-            if not os.path.exists(destination_dir):
-                os.makedirs(destination_dir)
-
-            full_filepath_on_disk = os.path.join(destination_dir, unique_filename)
-            
-            file.save(full_filepath_on_disk)
-            temp_saved_files.append(full_filepath_on_disk)
-
-            filesize_bytes = os.path.getsize(full_filepath_on_disk)
-
-            cursor.execute(
-                """
-                INSERT INTO attachments (
-                    log_record_id, filename, stored_filename, filepath, filetype, filesize_bytes
-                ) VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    log_id, original_filename, unique_filename,
-                    os.path.join(today_path, unique_filename),
-                    file.content_type, filesize_bytes
-                )
-            )
-        
-        conn.commit()
+        conn = get_db_connection()
+        with write_lock, conn:
+            cursor = conn.cursor()
+            begin_immediate(conn)
+
+            # The UPDATE's rowcount doubles as the existence check
+            cursor.execute(UPDATE_LOG_SQL, values + (log_id,))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                _remove_saved_files(temp_saved_files)
+                return jsonify({"error": "Log record not found"}), 404
+            cursor.execute(DELETE_IMPACT_TYPES_SQL, (log_id,))
+            cursor.executemany(INSERT_IMPACT_TYPE_SQL, [
+                (log_id, impact_type, position) for position, impact_type in enumerate(impact_types)
+            ])
+            cursor.executemany(INSERT_ATTACHMENT_SQL, [(log_id, *attachment) for attachment in attachments])
         return jsonify({"message": f"Log record {log_id} updated and new attachments added successfully"}), 200
 
     except (ValueError, sqlite3.Error) as e:
-        if conn: conn.execute('ROLLBACK;')
-        for fpath in temp_saved_files:
-            if os.path.exists(fpath):
-                os.remove(fpath)
-        current_app.logger.error(f"Error during record update/attachment add: {e}")
-        return jsonify({"error": str(e)}), 400 if isinstance(e, ValueError) else 500
+        _remove_saved_files(temp_saved_files)
+        current_app.logger.error("Error during record update/attachment add: %s", e)
+        return _error_response(str(e), 400 if isinstance(e, ValueError) else 500)
     except Exception as e:
-        if conn: conn.execute('ROLLBACK;')
-        for fpath in temp_saved_files:
-            if os.path.exists(fpath):
-                os.remove(fpath)
-        current_app.logger.error(f"An unexpected error occurred during record update/attachment add: {e}")
+        _remove_saved_files(temp_saved_files)
+        current_app.logger.exception("An unexpected error occurred during record update/attachment add")
         return jsonify({"error": "An unexpected server error occurred during record update", "details": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @logs_bp.route('/<int:log_id>', methods=['DELETE'])
 @login_required
 def delete_log_record(log_id):
-    conn = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
+        with write_lock, conn:
+            cursor = conn.cursor()
 
-        conn.execute('BEGIN TRANSACTION;')
+            begin_immediate(conn)
 
-        attachments_to_delete = conn.execute("SELECT filepath, stored_filename FROM attachments WHERE log_record_id = ?", (log_id,)).fetchall()
+            # Impact types go with the record via ON DELETE CASCADE; attachments are deleted first to learn their paths
+            attachments_to_delete = conn.execute(DELETE_LOG_ATTACHMENTS_SQL, (log_id,)).fetchall()
 
-        cursor.execute("DELETE FROM attachments WHERE log_record_id = ?", (log_id,))
+            cursor.execute(DELETE_LOG_RECORD_SQL, (log_id,))
 
-        cursor.execute("DELETE FROM log_records WHERE id = ?", (log_id,))
-
-        if cursor.rowcount == 0:
-            conn.execute('ROLLBACK;')
-            return jsonify({"error": "Log record not found"}), 404
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return jsonify({"error": "Log record not found"}), 404
 
-        conn.commit()
-
-        for att in attachments_to_delete:
-            full_filepath = os.path.join(Config.UPLOAD_FOLDER, att['filepath'])
-            if os.path.exists(full_filepath):
-                try:
-                    os.remove(full_filepath)
-                    current_app.logger.info(f"Deleted file: {full_filepath}")
-                    parent_dir = os.path.dirname(full_filepath)
-                    if os.path.exists(parent_dir) and parent_dir.startswith(Config.UPLOAD_FOLDER) and not os.listdir(parent_dir):
-                        os.rmdir(parent_dir)
-                        current_app.logger.info(f"Removed empty directory: {parent_dir}")
-                        year_dir = os.path.dirname(parent_dir)
-                        if os.path.exists(year_dir) and year_dir.startswith(Config.UPLOAD_FOLDER) and year_dir != Config.UPLOAD_FOLDER and not os.listdir(year_dir):
-                            os.rmdir(year_dir)
-                            current_app.logger.info(f"Removed empty year directory: {year_dir}")
-                except OSError as e:
-                    current_app.logger.error(f"Error deleting file or directory {full_filepath}: {e}")
+        if attachments_to_delete:
+            _file_cleanup_executor.submit(
+                _remove_attachment_files, [att['filepath'] for att in attachments_to_delete], current_app.logger
+            )
 
         return jsonify({"message": f"Log record {log_id} and its attachments deleted successfully"}), 200
 
     except Exception as e:
-        if conn: conn.execute('ROLLBACK;')
-        current_app.logger.error(f"An unexpected error occurred during log record deletion: {e}")
+        current_app.logger.exception("An unexpected error occurred during log record deletion")
         return jsonify({"error": "An unexpected server error occurred during record deletion", "details": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 
 @logs_bp.route('/attachments/<filename_to_find>', methods=['GET'])
 def download_attachment(filename_to_find):
-    conn = None
     try:
         conn = get_db_connection()
-        attachment_info = conn.execute(
-            "SELECT filename, stored_filename, filepath FROM attachments WHERE stored_filename = ?",
-            (filename_to_find,)
-        ).fetchone()
+        attachment_info = conn.execute(SELECT_ATTACHMENT_BY_STORED_FILENAME_SQL, (filename_to_find,)).fetchone()
 
         if attachment_info:
             original_filename = attachment_info['filename']
             stored_filename = attachment_info['stored_filename']
+
+            if current_app.config['USE_X_ACCEL_REDIRECT']:
+                # nginx serves the bytes with sendfile; the worker only returns these headers
+                mimetype = mimetypes.guess_type(original_filename)[0] or 'application/octet-stream'
+                response = current_app.response_class(mimetype=mimetype)
+                response.headers['X-Accel-Redirect'] = url_quote(
+                    current_app.config['X_ACCEL_REDIRECT_PREFIX'] + attachment_info['filepath'].replace(os.sep, '/')
+                )
+                response.headers.set('Content-Disposition', 'attachment', **_download_name_options(original_filename))
+                return response
+
             relative_dir = os.path.dirname(attachment_info['filepath'])
-            full_directory_to_serve_from = os.path.join(Config.UPLOAD_FOLDER, relative_dir)
+            # send_from_directory resolves relative paths against the app root, not the working directory.
+            # It answers conditional requests with 304 and hands the open file to wsgi.file_wrapper (or X-Sendfile)
+            full_directory_to_serve_from = os.path.join(os.path.abspath(Config.UPLOAD_FOLDER), relative_dir)
 
             return send_from_directory(
                 full_directory_to_serve_from,
@@ -415,81 +602,49 @@ def download_attachment(filename_to_find):
         else:
             return jsonify({"error": "File not found or not permitted"}), 404
     except Exception as e:
-        current_app.logger.error(f"Error serving attachment: {e}")
+        current_app.logger.error("Error serving attachment: %s", e)
         return jsonify({"error": "Could not serve file"}), 500
-    finally:
-        if conn: conn.close()
 
 @logs_bp.route('/attachments/<int:attachment_id>', methods=['DELETE'])
 @login_required
 def delete_attachment(attachment_id):
-    conn = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-
-        conn.execute('BEGIN TRANSACTION;')
+        with write_lock, conn:
+            cursor = conn.cursor()
 
-        attachment_info = conn.execute("SELECT log_record_id, filepath, stored_filename FROM attachments WHERE id = ?", (attachment_id,)).fetchone()
-        if attachment_info is None:
-            conn.execute('ROLLBACK;')
-            return jsonify({"error": "Attachment not found"}), 404
+            begin_immediate(conn)
 
-        log_record_id = attachment_info['log_record_id']
-        file_to_delete_path = attachment_info['filepath']
-        stored_filename_to_delete = attachment_info['stored_filename']
+            # One statement both deletes the row and reports the file it pointed at
+            attachment_info = cursor.execute(DELETE_ATTACHMENT_SQL, (attachment_id,)).fetchone()
+            if attachment_info is None:
+                conn.rollback()
+                return jsonify({"error": "Attachment not found"}), 404
 
-        cursor.execute("DELETE FROM attachments WHERE id = ?", (attachment_id,))
-        if cursor.rowcount == 0:
-            conn.execute('ROLLBACK;')
-            return jsonify({"error": "Attachment not found during deletion attempt"}), 404
+            file_to_delete_path = attachment_info['filepath']
+            stored_filename_to_delete = attachment_info['stored_filename']
 
-        conn.commit()
-
-        full_filepath = os.path.join(Config.UPLOAD_FOLDER, file_to_delete_path)
-        if os.path.exists(full_filepath):
-            try:
-                os.remove(full_filepath)
-                current_app.logger.info(f"Deleted physical attachment file: {full_filepath}")
-                parent_dir = os.path.dirname(full_filepath)
-                if os.path.exists(parent_dir) and parent_dir.startswith(Config.UPLOAD_FOLDER) and not os.listdir(parent_dir):
-                    os.rmdir(parent_dir)
-                    current_app.logger.info(f"Removed empty directory: {parent_dir}")
-                    year_dir = os.path.dirname(parent_dir)
-                    if os.path.exists(year_dir) and year_dir.startswith(Config.UPLOAD_FOLDER) and year_dir != Config.UPLOAD_FOLDER and not os.listdir(year_dir):
-                        os.rmdir(year_dir)
-                        current_app.logger.info(f"Removed empty year directory: {year_dir}")
-            except OSError as e:
-                current_app.logger.error(f"Error deleting file or directory {full_filepath}: {e}")
+        _file_cleanup_executor.submit(_remove_attachment_files, [file_to_delete_path], current_app.logger)
 
         return jsonify({"message": f"Attachment {stored_filename_to_delete} deleted successfully"}), 200
 
     except Exception as e:
-        if conn: conn.execute('ROLLBACK;')
-        current_app.logger.error(f"An unexpected error occurred during attachment deletion: {e}")
+        current_app.logger.exception("An unexpected error occurred during attachment deletion")
         return jsonify({"error": "An unexpected server error occurred during attachment deletion", "details": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 
 @logs_bp.route('/<int:log_record_id>/attachments', methods=['GET'])
 @login_required
 def get_log_record_attachments(log_record_id):
-    conn = None
     try:
         conn = get_db_connection()
-        attachments = conn.execute("SELECT * FROM attachments WHERE log_record_id = ?", (log_record_id,)).fetchall()
-
-        attachments_list = [dict(att) for att in attachments]
-        return jsonify(attachments_list), 200
+        body = conn.execute(SELECT_ATTACHMENTS_JSON_SQL, (log_record_id,)).fetchone()[0]
+        return current_app.response_class(body + '\n', mimetype='application/json'), 200
     except Exception as e:
-        current_app.logger.error(f"An unexpected error occurred fetching attachments: {e}")
+        current_app.logger.exception("An unexpected error occurred fetching attachments")
         return jsonify({"error": "An unexpected server error occurred fetching attachments", "details": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @logs_bp.route('/config/allowed_extensions', methods=['GET'])
 @login_required
 def get_allowed_extensions():
-    # Access ALLOWED_EXTENSIONS from Config object
-    return jsonify(list(Config.ALLOWED_EXTENSIONS)), 200
\ No newline at end of file
+    return allowed_extensions_response('private, max-age=86400')
\ No newline at end of file
@@ -0,0 +1,17 @@
+# trustlog_backend/spooled_request.py
+
+from tempfile import SpooledTemporaryFile
+from flask import Request
+
+# Uploads are capped at MAX_CONTENT_LENGTH (16 MB), so keeping typical attachments in memory is cheap
+UPLOAD_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+class SpooledRequest(Request):
+    """Flask request that buffers multipart file parts in memory up to UPLOAD_SPOOL_MAX_SIZE.
+
+    Werkzeug rolls each part over to an on-disk temp file past 500 KB, so saving a larger attachment wrote it to
+    disk twice: once while parsing and again when copied to its final path.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE, mode='rb+')
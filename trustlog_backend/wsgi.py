@@ -0,0 +1,7 @@
+# trustlog_backend/wsgi.py
+
+from trustlog_backend.app import create_app
+
+# Module-level application object for production WSGI servers, which serve requests concurrently, e.g.
+#   gunicorn -c trustlog_backend/gunicorn.conf.py trustlog_backend.wsgi:app
+app = create_app()